@@ -8,13 +8,14 @@ Supports two modes:
 - buffer: Screen buffer testing with pyte (good for full TUIs)
 """
 
-import asyncio
 import codecs
+import functools
 import pexpect
 import pyte
 import re
+import string
 import time
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, List, Tuple
 from mcp.server.fastmcp import FastMCP
 
 # Initialize FastMCP server
@@ -23,6 +24,67 @@ mcp = FastMCP("tui-test")
 # Compile ANSI escape regex once for performance
 ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
 
+# Control characters for Ctrl+A through Ctrl+Z
+_CTRL_MAP = {c: chr(i + 1) for i, c in enumerate(string.ascii_lowercase)}
+
+# Read size for draining process output into the pyte buffer
+READ_CHUNK_SIZE = 65536
+
+# Most output (characters) and time (seconds) one buffer sync will spend
+# draining, so a process that writes continuously cannot keep
+# _update_buffer reading forever
+READ_DRAIN_LIMIT = 4 * READ_CHUNK_SIZE
+READ_DRAIN_SECONDS = 0.1
+
+# Output must pause this long (seconds) before launch_tui treats the
+# application's first draw as finished
+LAUNCH_QUIET_SECONDS = 0.05
+
+# Stream mode reads only this many trailing characters of pexpect.before,
+# so capture and assert cost stays bounded on long-running sessions
+STREAM_TAIL_CHARS = 65536
+
+# How far before the tail cut to look for an escape sequence it splits
+ANSI_MAX_SEQUENCE = 256
+
+
+def _strip_ansi(text: str) -> str:
+    """
+    Remove ANSI escape sequences from text.
+
+    The character classes in ANSI_ESCAPE are disjoint, so the match never
+    backtracks and the scan stays linear. Text without an ESC character
+    is returned as-is without touching the regex engine.
+    """
+    if '\x1b' not in text:
+        return text
+    return ANSI_ESCAPE.sub('', text)
+
+
+def _stream_tail(text: str) -> str:
+    """
+    Return the last STREAM_TAIL_CHARS characters of text.
+
+    If the cut lands inside an ANSI escape sequence, it moves forward past
+    the sequence so no fragment like "[0;31m" leads the result.
+    """
+    start = len(text) - STREAM_TAIL_CHARS
+    if start <= 0:
+        return text
+
+    esc = text.rfind('\x1b', max(0, start - ANSI_MAX_SEQUENCE), start)
+    if esc >= 0:
+        match = ANSI_ESCAPE.match(text, esc)
+        if match and match.end() > start:
+            start = match.end()
+    return text[start:]
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_pattern(pattern: str) -> re.Pattern:
+    """Compile an expect pattern with pexpect's own flags, memoized."""
+    return re.compile(pattern, re.DOTALL)
+
 
 class ScreenSession:
     """
@@ -30,8 +92,8 @@ class ScreenSession:
 
     Attributes:
         process: pexpect.spawn instance
-        screen: pyte.Screen instance (buffer mode)
-        stream: pyte.Stream instance (buffer mode)
+        screen: pyte.Screen instance (buffer mode, created on first use)
+        stream: pyte.Stream instance (buffer mode, created on first use)
         mode: "stream" or "buffer"
         dimensions: (width, height) tuple
     """
@@ -46,61 +108,196 @@ class ScreenSession:
             command,
             timeout=timeout,
             dimensions=(height, width),
-            encoding='utf-8'
+            encoding='utf-8',
+            maxread=READ_CHUNK_SIZE
         )
 
-        # Initialize pyte screen buffer if in buffer mode
-        if mode == "buffer":
-            self.screen = pyte.Screen(width, height)
-            self.stream = pyte.Stream(self.screen)
-            # Start background task to feed output to pyte
-            self._update_buffer()
-
-    def _update_buffer(self):
-        """Update pyte screen buffer with latest process output."""
+        # Bumped on every pyte feed; keys the rendered display cache
+        self._feed_version = 0
+        self._display_cache: Optional[Tuple[int, str]] = None
+        # (raw pexpect.before, ANSI-stripped copy) for back-to-back reads
+        self._stripped_cache: Optional[Tuple[str, str]] = None
+
+        # pyte screen buffer is created lazily on the first send or read;
+        # until then launch output is parked in pexpect's buffer
+        self._screen: Optional[pyte.Screen] = None
+        self._stream: Optional[pyte.Stream] = None
+
+    def _ensure_screen(self):
+        """
+        Create the pyte screen and its stream if not yet created.
+
+        Output parked in pexpect's buffer at launch is fed in first, so the
+        screen starts from everything the process has printed.
+        """
+        if self._screen is None:
+            width, height = self.dimensions
+            self._screen = pyte.Screen(width, height)
+            self._stream = pyte.Stream(self._screen)
+
+            pending = self.process.buffer
+            if pending:
+                self.process.buffer = ""
+                self._stream.feed(pending)
+                self._feed_version += 1
+
+    @property
+    def screen(self) -> pyte.Screen:
+        """pyte screen buffer, created on first access."""
+        self._ensure_screen()
+        return self._screen
+
+    @property
+    def stream(self) -> pyte.Stream:
+        """pyte stream feeding the screen buffer, created on first access."""
+        self._ensure_screen()
+        return self._stream
+
+    def _update_buffer(self, timeout: float = 0.1):
+        """
+        Update pyte screen buffer with latest process output.
+
+        Waits up to ``timeout`` seconds for the first chunk of output.
+
+        The buffer accessors below are pure reads; tools call this once
+        before reading so each invocation pays for at most one wait.
+        """
         if self.mode != "buffer":
             return
 
-        try:
-            # Read available output without blocking
-            output = self.process.read_nonblocking(size=8192, timeout=0.1)
-            if output:
-                self.stream.feed(output)
-        except pexpect.TIMEOUT:
-            pass  # No new output, that's fine
-        except pexpect.EOF:
-            pass  # Process ended
-
-    def send(self, keys: str):
-        """Send keys to the process."""
-        self.process.send(keys)
-        time.sleep(0.1)
+        # Wait briefly for the first chunk, then drain whatever else is
+        # already pending without waiting again, stopping at whichever of
+        # READ_DRAIN_LIMIT or READ_DRAIN_SECONDS is hit first
+        drained = 0
+        deadline = None
+        while drained < READ_DRAIN_LIMIT and (deadline is None or time.monotonic() < deadline):
+            try:
+                output = self.process.read_nonblocking(size=READ_CHUNK_SIZE, timeout=timeout)
+            except pexpect.TIMEOUT:
+                break  # No new output, that's fine
+            except pexpect.EOF:
+                break  # Process ended
+            if not output:
+                break
+            if deadline is None:
+                deadline = time.monotonic() + READ_DRAIN_SECONDS
+            self.stream.feed(output)
+            self._feed_version += 1
+            drained += len(output)
+            timeout = 0
+
+    def _wait_until_quiet(self, timeout: float):
+        """
+        Wait for the process to print and then pause for LAUNCH_QUIET_SECONDS.
+
+        Gives up after timeout seconds or READ_CHUNK_SIZE characters. The
+        output read is parked in pexpect's buffer, where expect() looks
+        before reading and the pyte screen picks it up when created.
+        """
+        deadline = time.monotonic() + timeout
+        parts = []
+        parked = 0
+        while parked < READ_CHUNK_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait = min(LAUNCH_QUIET_SECONDS, remaining) if parts else remaining
+            try:
+                output = self.process.read_nonblocking(size=READ_CHUNK_SIZE, timeout=wait)
+            except pexpect.TIMEOUT:
+                break  # Output went quiet, or never started
+            except pexpect.EOF:
+                break  # Process ended
+            if not output:
+                break
+            parts.append(output)
+            parked += len(output)
+
+        if parts:
+            self.process.buffer = self.process.buffer + "".join(parts)
+
+    def _settle(self, wait: float):
+        """Give the process wait seconds to respond, then sync the buffer."""
+        if wait > 0:
+            time.sleep(wait)
         if self.mode == "buffer":
-            self._update_buffer()
+            self._update_buffer(timeout=0)
+
+    def send(self, keys: str, wait: float = 0.1):
+        """Send keys to the process, then wait ``wait`` seconds for it to respond."""
+        self.process.send(keys)
+        self._settle(wait)
+
+    def send_bulk(self, keys: List[str], inter_delay: float = 0, wait: float = 0.1):
+        """
+        Send a sequence of key strings, waiting only once at the end.
+
+        With no inter_delay the keys are joined and written in one call.
+        """
+        if inter_delay > 0:
+            for i, key in enumerate(keys):
+                if i:
+                    time.sleep(inter_delay)
+                self.process.send(key)
+        else:
+            self.process.send("".join(keys))
+
+        self._settle(wait)
 
     def get_stream_output(self, include_ansi: bool = False) -> str:
-        """Get stream-based output (pexpect.before)."""
+        """Get stream-based output (tail of pexpect.before)."""
         output = self.process.before if self.process.before else ""
-        if not include_ansi:
-            output = ANSI_ESCAPE.sub('', output)
-        return output
+        if include_ansi:
+            return _stream_tail(output)
+
+        # pexpect assigns a new string to before on every match, so an
+        # identity check is enough to know the stripped copy is current
+        if self._stripped_cache is not None and self._stripped_cache[0] is output:
+            return self._stripped_cache[1]
+
+        stripped = _strip_ansi(_stream_tail(output))
+        self._stripped_cache = (output, stripped)
+        return stripped
 
     def get_buffer_display(self) -> str:
         """Get screen buffer display (pyte)."""
         if self.mode != "buffer":
             return "Buffer mode not enabled for this session"
 
-        self._update_buffer()
-        return "\n".join(line.rstrip() for line in self.screen.display)
+        # Reuse the last render if nothing has been fed since
+        if self._display_cache is not None and self._display_cache[0] == self._feed_version:
+            return self._display_cache[1]
+
+        display = "\n".join(map(str.rstrip, self.screen.display))
+        self._display_cache = (self._feed_version, display)
+        return display
+
+    def _render_row(self, row: int) -> str:
+        """
+        Render one screen row to text at full width.
+
+        Matches a row of screen.display, but without the cost of rendering
+        every row, which screen.display does on each access.
+        """
+        line = self.screen.buffer[row]
+        return "".join([line[x].data for x in range(self.screen.columns)])
 
     def get_buffer_line(self, row: int) -> str:
         """Get a specific line from the screen buffer."""
         if self.mode != "buffer":
             return "Buffer mode not enabled for this session"
 
-        self._update_buffer()
         if 0 <= row < self.screen.lines:
-            return "".join(char.data for char in self.screen.buffer[row].values())
+            return self._render_row(row).rstrip()
+        return ""
+
+    def get_text_at(self, row: int, col: int, length: int) -> str:
+        """Get up to length characters starting at a screen position."""
+        if self.mode != "buffer":
+            return ""
+
+        if 0 <= row < self.screen.lines and col >= 0:
+            return self._render_row(row)[col:col + length]
         return ""
 
     def get_cursor_position(self) -> Tuple[int, int]:
@@ -108,7 +305,6 @@ class ScreenSession:
         if self.mode != "buffer":
             return (-1, -1)
 
-        self._update_buffer()
         return (self.screen.cursor.y, self.screen.cursor.x)
 
     def get_char_at(self, row: int, col: int) -> str:
@@ -116,7 +312,6 @@ class ScreenSession:
         if self.mode != "buffer":
             return ""
 
-        self._update_buffer()
         if 0 <= row < self.screen.lines and 0 <= col < self.screen.columns:
             char = self.screen.buffer[row].get(col)
             return char.data if char else " "
@@ -160,9 +355,9 @@ def launch_tui(
             width, height = 80, 24
 
         # Close existing session if it exists
-        if session_id in sessions:
-            sessions[session_id].close()
-            del sessions[session_id]
+        existing = sessions.pop(session_id, None)
+        if existing is not None:
+            existing.close()
 
         # Launch the TUI application
         session = ScreenSession(
@@ -174,8 +369,8 @@ def launch_tui(
 
         sessions[session_id] = session
 
-        # Give it a moment to initialize
-        time.sleep(0.5)
+        # Give it up to half a second to finish its first draw
+        session._wait_until_quiet(0.5)
 
         return f"✓ Launched TUI application (session: {session_id})\nCommand: {command}\nDimensions: {width}x{height}\nMode: {mode}"
 
@@ -201,17 +396,13 @@ def send_keys(
         Status message
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
         # Decode Python escape sequences (\x1b, \n, \t, etc.)
         decoded_keys = codecs.decode(keys, 'unicode_escape')
-        session.send(decoded_keys)
-
-        # Additional delay if requested
-        if delay > 0.1:
-            time.sleep(delay - 0.1)
+        session.send(decoded_keys, wait=delay)
 
         return f"✓ Sent keys to session {session_id}"
 
@@ -219,6 +410,43 @@ def send_keys(
         return f"✗ Failed to send keys: {str(e)}"
 
 
+@mcp.tool()
+def send_keys_batch(
+    keys: List[str],
+    session_id: str = "default",
+    inter_delay: float = 0,
+    final_delay: float = 0.1
+) -> str:
+    """
+    Send a sequence of keyboard inputs to a TUI application in one call.
+
+    Faster than calling send_keys once per key: the keys are written
+    together and the response wait is paid once, not per key.
+
+    Args:
+        keys: List of keys to send, each using the same escapes as send_keys
+        session_id: Session identifier (default: "default")
+        inter_delay: Seconds to pause between keys, 0 sends them all at once (default: 0)
+        final_delay: Delay in seconds after sending the last key (default: 0.1)
+
+    Returns:
+        Status message
+    """
+    try:
+        session = sessions.get(session_id)
+        if session is None:
+            return f"✗ No active session found: {session_id}"
+
+        # Decode Python escape sequences (\x1b, \n, \t, etc.)
+        decoded_keys = [codecs.decode(key, 'unicode_escape') for key in keys]
+        session.send_bulk(decoded_keys, inter_delay=inter_delay, wait=final_delay)
+
+        return f"✓ Sent {len(keys)} keys to session {session_id}"
+
+    except Exception as e:
+        return f"✗ Failed to send keys: {str(e)}"
+
+
 @mcp.tool()
 def capture_screen(
     session_id: str = "default",
@@ -237,16 +465,16 @@ def capture_screen(
         Current screen content
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
-
         # Determine which mode to use
         if use_buffer is None:
             use_buffer = (session.mode == "buffer")
 
         if use_buffer and session.mode == "buffer":
+            session._update_buffer()
             output = session.get_buffer_display()
             mode_label = "buffer"
         else:
@@ -277,14 +505,14 @@ def expect_text(
         Status message indicating if text was found
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
         session.process.timeout = timeout
 
         # Wait for the pattern
-        index = session.process.expect([pattern, pexpect.TIMEOUT, pexpect.EOF])
+        index = session.process.expect([_compile_pattern(pattern), pexpect.TIMEOUT, pexpect.EOF])
 
         # Update buffer if in buffer mode
         if session.mode == "buffer":
@@ -305,7 +533,8 @@ def expect_text(
 def assert_contains(
     text: str,
     session_id: str = "default",
-    use_buffer: Optional[bool] = None
+    use_buffer: Optional[bool] = None,
+    raw_precheck: bool = False
 ) -> str:
     """
     Assert that the current screen contains specific text.
@@ -314,23 +543,29 @@ def assert_contains(
         text: Text to search for in the current screen
         session_id: Session identifier (default: "default")
         use_buffer: Check buffer if True, stream if False. Auto-detect if None (default: None)
+        raw_precheck: In stream mode, fail fast if text is missing from the raw output
+            before stripping ANSI codes. Misses text split by escape codes (default: False)
 
     Returns:
         Success or failure message
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
-
         # Determine which mode to use
         if use_buffer is None:
             use_buffer = (session.mode == "buffer")
 
         if use_buffer and session.mode == "buffer":
+            session._update_buffer()
             output = session.get_buffer_display()
         else:
+            # Text absent from the raw output is almost always absent once
+            # stripped too, so skip the strip when the caller opts in
+            if raw_precheck and text not in session.get_stream_output(include_ansi=True):
+                return f"✗ Assertion failed: '{text}' not found in output"
             output = session.get_stream_output(include_ansi=False)
 
         if text in output:
@@ -362,18 +597,16 @@ def assert_at_position(
         Success or failure message
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
-
         if session.mode != "buffer":
             return f"✗ Buffer mode required for position-based assertions. Session '{session_id}' is in stream mode."
 
         # Get text at position
-        actual_text = ""
-        for i, char in enumerate(text):
-            actual_text += session.get_char_at(row, col + i)
+        session._update_buffer()
+        actual_text = session.get_text_at(row, col, len(text))
 
         if actual_text.strip() == text.strip():
             return f"✓ Assertion passed: Found '{text}' at position ({row}, {col})"
@@ -398,14 +631,14 @@ def get_cursor_position(
         Cursor position as (row, col)
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
-
         if session.mode != "buffer":
             return f"✗ Buffer mode required for cursor position. Session '{session_id}' is in stream mode."
 
+        session._update_buffer()
         row, col = session.get_cursor_position()
         return f"Cursor position (session: {session_id}): row {row}, column {col}"
 
@@ -435,11 +668,10 @@ def get_screen_region(
         Text content of the specified region
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
-
         if session.mode != "buffer":
             return f"✗ Buffer mode required for region extraction. Session '{session_id}' is in stream mode."
 
@@ -447,11 +679,12 @@ def get_screen_region(
         if col_end is None:
             col_end = session.dimensions[0]
 
-        # Extract region
+        # Extract region, rendering only the rows it covers
+        session._update_buffer()
         region_lines = []
         for row in range(row_start, row_end):
             line = session.get_buffer_line(row)
-            region_lines.append(line[col_start:col_end] if line else "")
+            region_lines.append(line[col_start:col_end])
 
         region_text = "\n".join(region_lines)
 
@@ -477,14 +710,14 @@ def get_line(
         Text content of the specified line
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
-
         if session.mode != "buffer":
             return f"✗ Buffer mode required for line extraction. Session '{session_id}' is in stream mode."
 
+        session._update_buffer()
         line = session.get_buffer_line(row)
         return f"Line {row} (session: {session_id}): {line}"
 
@@ -506,10 +739,10 @@ def close_session(
         Status message
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
         session.close()
         del sessions[session_id]
 
@@ -550,13 +783,14 @@ def send_ctrl(
         Status message
     """
     try:
-        if session_id not in sessions:
+        session = sessions.get(session_id)
+        if session is None:
             return f"✗ No active session found: {session_id}"
 
-        session = sessions[session_id]
-
         # Convert key to control character
-        ctrl_char = chr(ord(key.lower()) - ord('a') + 1)
+        ctrl_char = _CTRL_MAP.get(key.lower())
+        if ctrl_char is None:
+            return f"✗ Invalid ctrl key: {key}"
         session.send(ctrl_char)
 
         return f"✓ Sent Ctrl+{key.upper()} to session {session_id}"